@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import generate_template_diff  # noqa: E402
+
+
+class StubReader:
+    """Serve template contents from memory instead of git or disk."""
+
+    def __init__(self, contents):
+        self.contents = contents
+
+    def read(self, path):
+        return self.contents[path]
+
+
+class DiffTemplatesTest(unittest.TestCase):
+    """diff_templates() must render the same text as `git diff --no-index`."""
+
+    CASES = {
+        'changed line': ('a: 1\nb: 2\n', 'a: 1\nb: 3\n'),
+        'identical': ('a: 1\n', 'a: 1\n'),
+        'no newline on both sides': ('a: 1\nb: 2', 'a: 1\nb: 3'),
+        'newline added at end': ('a: 1\nb: 2', 'a: 1\nb: 2\n'),
+        'newline removed at end': ('a: 1\nb: 2\n', 'a: 1\nb: 2'),
+        'form feed inside a line': ('a: "foo\x0cbar"\nb: 2\n', 'a: "foo\x0cbar"\nb: 3\n'),
+        'crlf to cr': ('a: 1\r\nb: 2\r\n', 'a: 1\rb: 2\r'),
+        'lone cr and unicode separators': ('a: 1\rx\x85y z\nb: 2\n', 'a: 1\rx\x85y z\nb: 3\n'),
+    }
+
+    def git_diff(self, old, new):
+        with tempfile.TemporaryDirectory() as workdir:
+            for name, content in (('old.yaml', old), ('new.yaml', new)):
+                with open(os.path.join(workdir, name), 'wb') as f:
+                    f.write(content.encode('utf-8'))
+            result = subprocess.run(
+                ['git', 'diff', '--no-index', '--no-color', 'old.yaml', 'new.yaml'],
+                capture_output=True, cwd=workdir
+            )
+        output = result.stdout.decode('utf-8')
+        # diff_templates() does not reproduce git's blob hashes
+        return ''.join(line for line in output.splitlines(keepends=True) if not line.startswith('index '))
+
+    def test_matches_git_diff(self):
+        for name, (old, new) in self.CASES.items():
+            with self.subTest(name):
+                reader = StubReader({'old.yaml': old, 'new.yaml': new})
+                self.assertEqual(
+                    generate_template_diff.diff_templates(reader, 'old.yaml', 'new.yaml'),
+                    self.git_diff(old, new)
+                )
+
+
+if __name__ == '__main__':
+    unittest.main()